@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import UTC, datetime
 from pathlib import Path
 from random import randint
@@ -9,12 +10,16 @@ import re
 import subprocess
 import sys
 import textwrap
+import tomllib
 import urllib.error
 import urllib.request
 
 import click
 import jinja2
 
+from mkpkg import _prewarm
+from mkpkg._templates import TemplateSources, is_template_source
+
 STATUS_CLASSIFIERS = {
     "planning": "Development Status :: 1 - Planning",
     "prealpha": "Development Status :: 2 - Pre-Alpha",
@@ -32,8 +37,11 @@ VERSION_CLASSIFIERS = {
     "3.11": "Programming Language :: Python :: 3.11",
     "3.12": "Programming Language :: Python :: 3.12",
     "3.13": "Programming Language :: Python :: 3.13",
+    "3.13t": "Programming Language :: Python :: 3.13",
     "3.14": "Programming Language :: Python :: 3.14",
+    "3.14t": "Programming Language :: Python :: 3.14",
     "3.15": "Programming Language :: Python :: 3.15",
+    "3.15t": "Programming Language :: Python :: 3.15",
 }
 PYVERSION = re.compile(r"\d\.\d+")
 TEST_DEP = {
@@ -41,15 +49,27 @@ TEST_DEP = {
     "twisted.trial": "twisted",
     "virtue": "virtue",
 }
-TEMPLATE = Path(__file__).with_name("template")
+PARALLEL_TEST_RUNNERS = {"pytest", "twisted.trial"}
+CONFIG = (
+    Path(os.environ.get("XDG_CONFIG_HOME", "~/.config")).expanduser()
+    / "mkpkg"
+    / "config.toml"
+)
 
 READTHEDOCS_IMPORT_URL = "https://readthedocs.org/dashboard/import/manual/"
 
 GITHUB_ACTIONS = {
+    "cache": "actions/cache",
     "checkout": "actions/checkout",
     "setup_uv": "astral-sh/setup-uv",
     "pypi_publish": "pypa/gh-action-pypi-publish",
 }
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+WHEEL_GITHUB_ACTIONS = {
+    "cibuildwheel": "pypa/cibuildwheel",
+    "download_artifact": "actions/download-artifact",
+    "upload_artifact": "actions/upload-artifact",
+}
 
 
 def _github_api(url):
@@ -63,28 +83,64 @@ def resolve_action(repo):
     """Resolve a GitHub Action to its latest release pinned by SHA."""
     try:
         release = _github_api(
-            f"https://api.github.com/repos/{repo}/releases/latest",
+            f"{GITHUB_API_URL}/repos/{repo}/releases/latest",
         )
         tag = release["tag_name"]
         commit = _github_api(
-            f"https://api.github.com/repos/{repo}/commits/{tag}",
+            f"{GITHUB_API_URL}/repos/{repo}/commits/{tag}",
         )
         return f"{repo}@{commit['sha']}  # {tag}"
     except (urllib.error.URLError, OSError):
         return repo
 
 
-def resolve_all_actions():
-    """Resolve all GitHub Actions to pinned SHA references."""
-    return {
-        name: resolve_action(repo) for name, repo in GITHUB_ACTIONS.items()
+def start_resolving_actions(actions=GITHUB_ACTIONS):
+    """
+    Start resolving GitHub Actions to pinned SHA references in the background.
+
+    Returns futures for each pin, which are all resolved concurrently.
+    """
+    executor = ThreadPoolExecutor(max_workers=len(actions))
+    pins = {
+        name: executor.submit(resolve_action, repo)
+        for name, repo in actions.items()
     }
+    executor.shutdown(wait=False)
+    return pins
 
 
 def dedented(*args, **kwargs):
     return textwrap.dedent(*args, **kwargs).lstrip("\n")
 
 
+def load_config(context, param, path):
+    """
+    Use the contents of a config file as defaults for options not given.
+
+    Keys are option names (e.g. ``github-owner``), and relative template
+    sources are relative to the config file itself.
+    """
+    source = context.get_parameter_source(param.name)
+    if source == click.core.ParameterSource.DEFAULT and not path.exists():
+        return
+
+    try:
+        config = tomllib.loads(path.read_text())
+    except (OSError, tomllib.TOMLDecodeError) as error:
+        raise click.BadParameter(str(error), context, param)
+
+    template_source = config.get("template-source", [])
+    if isinstance(template_source, str):
+        template_source = [template_source]
+    config["template-source"] = [
+        path.parent / Path(each).expanduser() for each in template_source
+    ]
+
+    context.default_map = {
+        key.replace("-", "_"): value for key, value in config.items()
+    }
+
+
 @click.command()
 @click.argument("name")
 @click.option(
@@ -153,6 +209,26 @@ def dedented(*args, **kwargs):
     default=False,
     help="include a build script for CFFI modules",
 )
+@click.option(
+    "--lazy/--no-lazy",
+    default=False,
+    help="lazily import public names from submodules on first access.",
+)
+@click.option(
+    "--mypyc/--no-mypyc",
+    default=False,
+    help="compile the package to native extension modules with mypyc.",
+)
+@click.option(
+    "--memory-budgets/--no-memory-budgets",
+    default=False,
+    help="include tests which check memory use against recorded budgets.",
+)
+@click.option(
+    "--parallel/--no-parallel",
+    default=False,
+    help="run tests in parallel across all available cores.",
+)
 @click.option(
     "--style/--no-style",
     "style",
@@ -174,6 +250,54 @@ def dedented(*args, **kwargs):
     default="Julian",
     help="the GitHub owner or organization for the package",
 )
+@click.option(
+    "--prewarm/--no-prewarm",
+    default=False,
+    help=(
+        "lock dependencies and install each nox environment once the package "
+        "is created, filling uv's cache (in the background by default)"
+    ),
+)
+@click.option(
+    "--foreground",
+    is_flag=True,
+    default=False,
+    help="prewarm in the foreground, waiting for it to finish",
+)
+@click.option(
+    "--find-links",
+    default=None,
+    help="a directory (or URL) of distributions to prewarm from",
+)
+@click.option(
+    "--index-url",
+    default=None,
+    help="a package index to prewarm from",
+)
+@click.option(
+    "--offline/--online",
+    default=False,
+    help="prewarm only from packages already in uv's cache",
+)
+@click.option(
+    "--template-source",
+    multiple=True,
+    type=click.Path(exists=True, path_type=Path),
+    help=(
+        "a directory or zip file of templates overriding the built in ones "
+        "(later ones take priority over earlier ones)"
+    ),
+)
+@click.option(
+    "--config",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=CONFIG,
+    show_default=True,
+    is_eager=True,
+    expose_value=False,
+    callback=load_config,
+    help="a TOML file of defaults for any of these options",
+)
 @click.version_option(prog_name="mkpkg")
 def main(
     name,
@@ -181,6 +305,8 @@ def main(
     author_email,
     cffi,
     cli,
+    lazy,
+    mypyc,
     readme,
     test_runner,
     supports,
@@ -188,10 +314,18 @@ def main(
     docs,
     single_module,
     bare,
+    memory_budgets,
+    parallel,
     style,
     init_vcs,
     closed,
     github_owner,
+    prewarm,
+    foreground,
+    find_links,
+    index_url,
+    offline,
+    template_source,
 ):
     """
     Oh how exciting! Create a new Python package.
@@ -203,6 +337,7 @@ def main(
     else:
         package_name = name
     package_name = package_name.lower().replace("-", "_")
+    free_threaded = any(version.endswith("t") for version in supports)
 
     supports = sorted(
         supports,
@@ -212,8 +347,13 @@ def main(
         ),
     )
 
+    for each in template_source:
+        if not is_template_source(each):
+            sys.exit(f"{each} is neither a directory nor a zip file.")
+
+    loader = TemplateSources(template_source)
     env = jinja2.Environment(
-        loader=jinja2.PackageLoader("mkpkg", "template"),
+        loader=loader,
         undefined=jinja2.StrictUndefined,
         keep_trailing_newline=True,
     )
@@ -223,24 +363,62 @@ def main(
         cli=cli,
         closed=closed,
         docs=docs,
+        free_threaded=free_threaded,
         github_owner=github_owner,
+        lazy=lazy,
+        memory_budgets=memory_budgets,
+        minimum_python_version=PYVERSION.search(supports[0])[0],  # ty: ignore[not-subscriptable]
+        mypyc=mypyc,
         name=name,
         now=datetime.now(tz=UTC),  # ty: ignore[invalid-argument-type]
         package_name=package_name,
+        parallel=parallel,
         single_module=single_module,
         style=style,
         supports=supports,  # ty: ignore[invalid-argument-type]
         test_runner=test_runner,
     )
 
+    if parallel and test_runner not in PARALLEL_TEST_RUNNERS:
+        sys.exit(f"Cannot run {test_runner} tests in parallel.")
+    if cffi and mypyc:
+        sys.exit("Cannot combine a CFFI extension with mypyc.")
+    if lazy and mypyc:
+        # mypyc-compiled modules defining __getattr__ crash on import.
+        sys.exit("Cannot compile lazily loaded packages with mypyc.")
+    if single_module:
+        if len(cli) > 1:
+            sys.exit("Cannot create a single module with multiple CLIs.")
+        if lazy:
+            sys.exit("Cannot lazily load submodules of a single module.")
+        if cffi:
+            sys.exit("Cannot create a single module with a CFFI extension.")
+        if mypyc:
+            sys.exit("Cannot compile a single module with mypyc.")
+    if bare and prewarm:
+        sys.exit("Cannot prewarm a bare package.")
+    if not prewarm and (foreground or find_links or index_url or offline):
+        sys.exit(
+            "--foreground, --find-links, --index-url and --offline "
+            "need --prewarm.",
+        )
+
+    # Pinning actions means waiting on the network, which only ci.yml needs,
+    # so get that going now, and render it last, after everything else is
+    # written.
+    pins = {}
+    if not closed and not bare:
+        actions = GITHUB_ACTIONS
+        if cffi or mypyc:
+            actions = actions | WHEEL_GITHUB_ACTIONS
+        pins = start_resolving_actions(actions)
+
     package = Path(package_name)
 
     if single_module:
         tests = "tests.py"
 
-        if len(cli) > 1:
-            sys.exit("Cannot create a single module with multiple CLIs.")
-        elif cli:
+        if cli:
             scripts = [f'{cli[0]} = "{package_name}:main"']
             script = env.get_template("package/_cli.py.j2").render(
                 program_name=cli[0],
@@ -250,9 +428,15 @@ def main(
             script = '"""\nFill me in!\n"""\n'
 
         script_name = package_name + ".py"
+        thread_unsafe = {"TestConcurrently"}
+        if memory_budgets:
+            thread_unsafe.add("TestMemoryBudgets")
         core_source_paths = {
             Path(script_name): script,
-            Path("tests.py"): env.get_template("tests.py.j2").render(),
+            Path("tests.py"): env.get_template("tests.py.j2").render(
+                test_modules="[sys.modules[__name__]]",
+                thread_unsafe=thread_unsafe,
+            ),
         }
 
     else:
@@ -266,10 +450,50 @@ def main(
             tests / "test_integration.py": integration.render(),
         }
 
+        if lazy:
+            core_source_paths[tests / "test_lazy.py"] = env.get_template(
+                "package/tests/test_lazy.py.j2",
+            ).render()
+
+        if memory_budgets:
+            core_source_paths[tests / "_memory.py"] = env.get_template(
+                "package/tests/_memory.py.j2",
+            ).render()
+            core_source_paths[tests / "test_memory.py"] = env.get_template(
+                "package/tests/test_memory.py.j2",
+            ).render()
+
+        if free_threaded:
+            thread_unsafe = {"test_threading"}
+            if lazy:
+                thread_unsafe.add("test_lazy")
+            if memory_budgets:
+                thread_unsafe.add("test_memory")
+            core_source_paths[tests / "test_threading.py"] = env.get_template(
+                "package/tests/test_threading.py.j2",
+            ).render(
+                cname=_cname(package_name),
+                test_modules="_test_modules()",
+                thread_unsafe=thread_unsafe,
+            )
+
         if cffi:
-            core_source_paths[package / "_build.py"] = env.get_template(
-                "package/_build.py.j2",
-            ).render(cname=_cname(name))
+            cname = _cname(package_name)
+            core_source_paths.update(
+                (
+                    package / each,
+                    env.get_template(f"package/{each}.j2").render(
+                        cname=cname,
+                    ),
+                )
+                for each in ["_build.py", "_native.py", "_pure.py"]
+            )
+            core_source_paths[package / f"{cname}.pyi"] = loader.read(
+                "package/_cffi.pyi",
+            )
+            core_source_paths[tests / "test_native.py"] = env.get_template(
+                "package/tests/test_native.py.j2",
+            ).render()
 
         if len(cli) == 1:
             scripts = [f'{cli[0]} = "{package_name}._cli:main"']
@@ -295,10 +519,11 @@ def main(
 
     dependencies = []
     if cffi:
-        dependencies.append("cffi>=1.0.0")
+        dependencies.append("cffi>=2.0.0" if free_threaded else "cffi>=1.0.0")
     if scripts:
         dependencies.append("click")
 
+    wheel_builds = _wheel_builds(supports, limited_api=not mypyc)
     files = {
         "README.rst": env.get_template("README.rst.j2").render(
             contents=readme,
@@ -329,26 +554,25 @@ def main(
             ),
             pypy=any(version.startswith("pypy") for version in supports),
             jython="jython" in supports,
-            minimum_python_version=PYVERSION.search(supports[0])[0],  # ty: ignore[not-subscriptable]
+            wheel_builds=wheel_builds,
+            wheel_enable=_wheel_enable(supports, wheel_builds),
         ),
-        ".pre-commit-config.yaml": template(".pre-commit-config.yaml"),
+        ".pre-commit-config.yaml": loader.read(".pre-commit-config.yaml"),
         "noxfile.py": env.get_template("noxfile.py.j2").render(
             test_dep=TEST_DEP[test_runner],
             tests=tests,
         ),
     }
 
-    if not closed:
-        actions = resolve_all_actions()
-        files[".github/workflows/ci.yml"] = env.get_template(
-            ".github/workflows/ci.yml.j2",
-        ).render(
-            actions=actions,
-            schedule_hour=randint(3, 7),
-            schedule_minute=randint(0, 59),
+    if cffi:
+        files["hatch_build.py"] = env.get_template("hatch_build.py.j2").render(
+            limited_api=_limited_api(supports),
         )
-        files[".github/dependabot.yml"] = template(".github/dependabot.yml")
-        files[".github/FUNDING.yml"] = template(".github/FUNDING.yml")
+        files["benchmarks.py"] = env.get_template("benchmarks.py.j2").render()
+
+    if not closed:
+        files[".github/dependabot.yml"] = loader.read(".github/dependabot.yml")
+        files[".github/FUNDING.yml"] = loader.read(".github/FUNDING.yml")
         files[".github/SECURITY.md"] = env.get_template(
             ".github/SECURITY.md.j2",
         ).render()
@@ -398,8 +622,8 @@ def main(
 
         conf = env.get_template("docs/conf.py.j2").render()
         (docs / "conf.py").write_text(conf)
-        (docs / "index.rst").write_text(template("docs/index.rst"))
-        (docs / ".readthedocs.yml").write_text(template(".readthedocs.yml"))
+        (docs / "index.rst").write_text(loader.read("docs/index.rst"))
+        (docs / ".readthedocs.yml").write_text(loader.read(".readthedocs.yml"))
 
         click.echo(f"Set up documentation at: {READTHEDOCS_IMPORT_URL}")
 
@@ -418,12 +642,88 @@ def main(
                 ),
             )
 
-
-def template(*segments):
-    return TEMPLATE.joinpath(*segments).read_text()
+    if pins:
+        workflows = root / ".github" / "workflows"
+        workflows.mkdir(parents=True, exist_ok=True)
+        ci = env.get_template(".github/workflows/ci.yml.j2").render(
+            actions={name: pin.result() for name, pin in pins.items()},
+            schedule_hour=randint(3, 7),
+            schedule_minute=randint(0, 59),
+        )
+        (workflows / "ci.yml").write_text(dedented(ci))
+
+    if prewarm:
+        prewarming = _prewarm.prewarm(
+            root,
+            background=not foreground,
+            find_links=find_links,
+            index_url=index_url,
+            offline=offline,
+        )
+        if not foreground:
+            click.echo(
+                f"Prewarming in the background (pid {prewarming.pid}), "
+                f"see {root / _prewarm.LOG} for progress.",
+            )
+        elif prewarming.returncode:
+            sys.exit("Prewarming failed.")
 
 
-def _cname(name):
-    name = name.removesuffix("-cffi")
+def _cname(package_name):
+    """
+    The name of the compiled extension module within the package.
+    """
+    name = package_name.removesuffix("_cffi")
     name = name.removeprefix("lib")
     return "_" + name
+
+
+def _limited_api(supports):
+    """
+    The oldest supported CPython, whose limited API extensions are built for.
+    """
+    for each in supports:
+        if not each.startswith("pypy") and not each.endswith("t"):
+            return "cp" + each.replace(".", "")
+    return "cp" + PYVERSION.search(supports[0])[0].replace(".", "")  # ty: ignore[not-subscriptable]
+
+
+def _wheel_builds(supports, limited_api=True):
+    """
+    The cibuildwheel build selectors needed to cover ``supports``.
+
+    A single limited API wheel covers every CPython, so only the oldest one is
+    built for (if any are supported), along with each free-threaded CPython
+    and each version of PyPy, which have no stable ABI.
+
+    Without the limited API (i.e. for mypyc) each CPython gets its own wheel,
+    and PyPy is left to the interpreted one.
+    """
+    builds = []
+    if limited_api and any(
+        not each.startswith("pypy") and not each.endswith("t")
+        for each in supports
+    ):
+        builds.append(f"{_limited_api(supports)}-*")
+    for each in supports:
+        if not each.startswith("pypy"):
+            if each.endswith("t") or not limited_api:
+                builds.append(f"cp{each.replace('.', '')}-*")
+        elif limited_api:
+            builds.append(f"pp{each.removeprefix('pypy').replace('.', '')}-*")
+    return builds
+
+
+def _wheel_enable(supports, builds):
+    """
+    The cibuildwheel groups which must be enabled to build ``builds``.
+
+    cibuildwheel skips both PyPy and CPython 3.13's (experimental)
+    free-threaded build unless asked for them.
+    """
+    enable = []
+    if "3.13t" in supports:
+        enable.append("cpython-freethreading")
+    if any(each.startswith("pp") for each in builds):
+        enable.append("pypy")
+    return enable
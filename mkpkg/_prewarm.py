@@ -0,0 +1,137 @@
+"""
+Get a freshly created project ready for its first ``nox`` run.
+
+Its dependencies are locked, and each of its nox environments is installed
+once, which fills uv's (shared) cache so that later runs needn't resolve,
+download or build anything.
+"""
+
+from pathlib import Path
+import json
+import os
+import shlex
+import subprocess
+import sys
+
+import click
+
+#: Where progress is written when prewarming in the background.
+LOG = Path(".nox", "prewarm.log")
+
+
+def prewarm(
+    project,
+    background=True,
+    find_links=None,
+    index_url=None,
+    offline=False,
+):
+    """
+    Prewarm a project, by default in a detached background process.
+
+    Packages are installed from the given find links directory or index
+    (either of which is enough on its own), or only from uv's cache when
+    offline. The project itself is locked against its real index (offline,
+    from the cache) so that its lock works anywhere else, falling back to
+    the given packages only when that index can't be reached.
+    """
+    env = dict(os.environ)
+    if offline:
+        env["UV_OFFLINE"] = "1"
+
+    sources = {}
+    if find_links is not None:
+        if Path(find_links).exists():
+            find_links = Path(find_links).absolute()
+        sources["UV_FIND_LINKS"] = str(find_links)
+        if index_url is None:
+            sources["UV_NO_INDEX"] = "1"
+    if index_url is not None:
+        sources["UV_DEFAULT_INDEX"] = index_url
+
+    argv = [
+        sys.executable,
+        "-m",
+        "mkpkg._prewarm",
+        str(project),
+        json.dumps(sources),
+    ]
+    if not background:
+        return subprocess.run(argv, env=env, check=False)
+
+    log = project / LOG
+    log.parent.mkdir(parents=True, exist_ok=True)
+    with log.open("w") as output:
+        return subprocess.Popen(
+            argv,
+            env=env,
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,  # i.e. keep going after we exit
+        )
+
+
+def main(project, sources):
+    """
+    Lock a project, then install each of its nox sessions in turn.
+
+    Only installing uses the given package sources (as uv environment
+    variables), unless locking without them fails. Installing may re-lock
+    the project against them, so its lock is put back afterwards.
+    """
+    failed = []
+
+    def run(step, i, total, env=None):
+        click.echo(f"[{i}/{total}] {shlex.join(step)}")
+        return subprocess.run(step, cwd=project, env=env, check=False)
+
+    listed = subprocess.run(
+        ["uvx", "nox", "--list-sessions", "--json"],
+        cwd=project,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if listed.returncode:
+        click.echo(f"Couldn't list nox sessions:\n{listed.stderr}")
+        sessions = []
+    else:
+        sessions = [each["session"] for each in json.loads(listed.stdout)]
+
+    total = len(sessions) + 1
+    env = os.environ | sources
+    lock, locked = project / "uv.lock", None
+    unlocked = run(["uv", "lock"], 1, total).returncode
+    if unlocked and sources:
+        click.echo(
+            "Couldn't lock against the project's index, so locking against "
+            "the given packages instead. Re-run uv lock once it's reachable, "
+            "as this lock won't work elsewhere.",
+        )
+        unlocked = run(["uv", "lock"], 1, total, env).returncode
+    if unlocked:
+        failed.append("uv lock")
+    elif lock.exists():
+        locked = lock.read_bytes()
+
+    for i, session in enumerate(sessions, 2):
+        step = ["uvx", "nox", "--install-only", "-s", session]
+        if run(step, i, total, env).returncode:
+            failed.append(shlex.join(step))
+    if locked is None:
+        lock.unlink(missing_ok=True)
+    else:
+        lock.write_bytes(locked)
+
+    if failed:
+        click.echo(f"Done, but {len(failed)} step(s) failed:")
+        for each in failed:
+            click.echo(f"  {each}")
+        return 1
+    click.echo("Done.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(Path(sys.argv[1]), json.loads(sys.argv[2])))
@@ -0,0 +1,117 @@
+"""
+Loading templates from mkpkg's own template directory and any overlays on it.
+"""
+
+from hashlib import sha256
+from pathlib import Path
+import mmap
+import zipfile
+
+import jinja2
+
+#: mkpkg's own templates, which any other sources are layered over.
+BUILTIN = Path(__file__).with_name("template")
+
+
+class TemplateSources(jinja2.BaseLoader):
+    """
+    Templates from a stack of directories or zip files.
+
+    Sources later in the stack take priority over earlier ones, so each can
+    override (or add to) individual templates from those beneath it.
+
+    Every source is indexed once up front, making a lookup a single dict
+    access however many sources are layered, and compiled templates are
+    cached by their name and the hash of their contents.
+    """
+
+    def __init__(self, sources=()):
+        self._index = {}
+        for source in [_Directory(BUILTIN), *map(_open, sources)]:
+            self._index.update(dict.fromkeys(source.names(), source))
+        self._compiled = {}
+
+    def get_source(self, environment, template):
+        source = self._index.get(template)
+        if source is None:
+            raise jinja2.TemplateNotFound(template)
+        return source.read(template), source.filename(template), None
+
+    def list_templates(self):
+        return sorted(self._index)
+
+    def load(self, environment, name, globals=None):
+        """
+        Load a template, compiling its contents only if they're new to us.
+        """
+        contents, filename, uptodate = self.get_source(environment, name)
+        # The name is compiled into the code (e.g. for tracebacks), so it's
+        # part of the key too.
+        key = name, sha256(contents.encode()).digest()
+        code = self._compiled.get(key)
+        if code is None:
+            code = environment.compile(contents, name, filename)
+            self._compiled[key] = code
+        return environment.template_class.from_code(
+            environment,
+            code,
+            globals,
+            uptodate,
+        )
+
+    def read(self, name):
+        """
+        The contents of a (non-template) file, without any rendering.
+        """
+        source = self._index.get(name)
+        if source is None:
+            raise jinja2.TemplateNotFound(name)
+        return source.read(name)
+
+
+def is_template_source(path):
+    """
+    Is the given path something we can load templates from?
+    """
+    return path.is_dir() or zipfile.is_zipfile(path)
+
+
+def _open(path):
+    path = Path(path).expanduser()
+    return _Directory(path) if path.is_dir() else _Zip(path)
+
+
+class _Directory:
+    def __init__(self, path):
+        self._path = path
+
+    def names(self):
+        return [
+            path.relative_to(self._path).as_posix()
+            for path in self._path.rglob("*")
+            if path.is_file()
+        ]
+
+    def filename(self, name):
+        return str(self._path / name)
+
+    def read(self, name):
+        return (self._path / name).read_text()
+
+
+class _Zip:
+    def __init__(self, path):
+        self._path = path
+        with path.open("rb") as file:
+            contents = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._zip = zipfile.ZipFile(contents)
+
+    def names(self):
+        infos = self._zip.infolist()
+        return [each.filename for each in infos if not each.is_dir()]
+
+    def filename(self, name):
+        return f"{self._path}/{name}"
+
+    def read(self, name):
+        return self._zip.read(name).decode()
@@ -1,11 +1,20 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from tempfile import TemporaryDirectory
+from threading import Thread
 from unittest import TestCase
 import json
 import os
+import runpy
 import subprocess
 import sys
+import time
+import tomllib
+import zipfile
+
+import jinja2
 
 from mkpkg._cli import Path
+from mkpkg._templates import TemplateSources
 
 
 class TestMkpkg(TestCase):
@@ -19,6 +28,40 @@ class TestMkpkg(TestCase):
         _fix_readme(root / "foo")
         self.assertNoxSucceeds(root / "foo")
 
+    def test_linkcheck_remembers_recently_working_links(self):
+        foo = self.mkpkg("foo", "--docs") / "foo"
+        noxfile = runpy.run_path(str(foo / "noxfile.py"))
+        record, recent = noxfile["_record_links"], noxfile["_recently_working"]
+
+        now = time.time()
+        links, output = self.tmpdir() / "links.json", self.tmpdir() / "out"
+        links.write_text(
+            json.dumps(
+                {
+                    "https://stale.example": now - 2 * 24 * 60 * 60,
+                    "https://moved.example": now,
+                    "https://ignored.example": now,
+                },
+            ),
+        )
+        output.write_text(
+            "\n".join(
+                json.dumps({"uri": uri, "status": status})
+                for uri, status in [
+                    ("https://working.example", "working"),
+                    ("https://moved.example", "redirected"),
+                    ("https://broken.example", "broken"),
+                    ("https://ignored.example", "ignored"),
+                ]
+            ),
+        )
+
+        record(links, output)
+        self.assertEqual(
+            sorted(recent(links)),
+            ["https://ignored.example", "https://working.example"],
+        )
+
     def test_it_creates_single_modules_that_pass_their_tests(self):
         root = self.mkpkg("foo", "--single")
         _fix_readme(root / "foo")
@@ -29,6 +72,441 @@ class TestMkpkg(TestCase):
         _fix_readme(root / "foo")
         self.assertNoxSucceeds(root / "foo")
 
+    def test_it_creates_cffi_packages_with_hyphenated_names(self):
+        root = self.mkpkg("foo-bar", "--cffi")
+        _fix_readme(root / "foo-bar")
+        self.assertNoxSucceeds(root / "foo-bar")
+
+    def test_it_builds_pypy_cffi_wheels(self):
+        foo = self.mkpkg("foo", "--cffi", "--supports", "pypy3.11") / "foo"
+        pyproject = tomllib.loads((foo / "pyproject.toml").read_text())
+        cibuildwheel = pyproject["tool"]["cibuildwheel"]
+        self.assertEqual(cibuildwheel["build"], ["pp311-*"])
+        self.assertEqual(cibuildwheel["enable"], ["pypy"])
+
+    def test_it_builds_only_free_threaded_cffi_wheels_when_asked(self):
+        foo = self.mkpkg("foo", "--cffi", "--supports", "3.14t") / "foo"
+        pyproject = tomllib.loads((foo / "pyproject.toml").read_text())
+        cibuildwheel = pyproject["tool"]["cibuildwheel"]
+        self.assertEqual(cibuildwheel["build"], ["cp314t-*"])
+
+    def test_it_creates_lazy_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--lazy")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_it_creates_lazy_trial_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--lazy", "-t", "twisted.trial")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_it_creates_lazy_virtue_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--lazy", "-t", "virtue")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_lazy_packages_import_submodules_only_when_accessed(self):
+        foo = self.mkpkg("foo", "--lazy", "--cli", "foo") / "foo"
+        loaded = subprocess.check_output(
+            [sys.executable, "-c", ACCESS_LAZILY],
+            cwd=foo,
+            text=True,
+        ).split()
+        self.assertEqual(loaded, ["False", "True"])
+
+    def test_it_refuses_lazy_single_modules(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--lazy", "--single")
+
+    def test_it_creates_memory_budgets_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--memory-budgets")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_it_creates_trial_memory_budgets_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--memory-budgets", "-t", "twisted.trial")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_it_creates_virtue_memory_budgets_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--memory-budgets", "-t", "virtue")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_it_creates_single_module_memory_budgets(self):
+        root = self.mkpkg("foo", "--single", "--memory-budgets")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_memory_budgets_are_formatted(self):
+        foo = self.mkpkg("foo", "--memory-budgets") / "foo"
+        self.assertFormatted(foo / "foo")
+
+    def test_single_module_memory_budgets_are_formatted(self):
+        foo = self.mkpkg("foo", "--single", "--memory-budgets") / "foo"
+        self.assertFormatted(foo / "foo.py", foo / "tests.py")
+
+    def test_it_records_memory_budgets(self):
+        foo = self.mkpkg("foo", "--memory-budgets") / "foo"
+        self.nox(foo, "-s", "memory_budgets-3.14")
+        budgets = json.loads(
+            (foo / "foo" / "tests" / "memory-budgets.json").read_text(),
+        )
+        self.assertIn("import", budgets["cpython-314"])
+
+    def test_it_creates_parallel_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--parallel")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_it_creates_parallel_trial_packages(self):
+        root = self.mkpkg("foo", "--parallel", "-t", "twisted.trial")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+        self.assertNoxSucceeds(
+            root / "foo",
+            "-s",
+            "tests-3.14",
+            "--",
+            "coverage",
+        )
+
+    def test_it_refuses_parallel_runs_for_runners_without_them(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--parallel", "-t", "virtue")
+
+    def test_it_creates_cffi_benchmarks(self):
+        root = self.mkpkg("foo", "--cffi")
+        self.assertNoxSucceeds(root / "foo", "-s", "benchmark")
+
+    def test_it_refuses_cffi_single_modules(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--cffi", "--single")
+
+    def test_it_creates_free_threaded_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--supports", "3.14t", "--supports", "3.14")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_it_creates_free_threaded_single_modules(self):
+        root = self.mkpkg(
+            "foo",
+            "--single",
+            "--memory-budgets",
+            "--supports",
+            "3.14t",
+            "--supports",
+            "3.14",
+        )
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_free_threaded_tests_are_formatted(self):
+        foo = self.mkpkg(
+            "foo",
+            "--memory-budgets",
+            "--supports",
+            "3.14t",
+            "--supports",
+            "3.14",
+        )
+        self.assertFormatted(foo / "foo" / "foo")
+
+    def test_free_threaded_single_module_without_budgets_is_formatted(self):
+        foo = self.mkpkg("foo", "--single", "--supports", "3.14t")
+        self.assertFormatted(foo / "foo" / "foo.py", foo / "foo" / "tests.py")
+
+    def test_free_threaded_single_module_tests_are_formatted(self):
+        foo = self.mkpkg(
+            "foo",
+            "--single",
+            "--memory-budgets",
+            "--supports",
+            "3.14t",
+            "--supports",
+            "3.14",
+        )
+        self.assertFormatted(foo / "foo" / "foo.py", foo / "foo" / "tests.py")
+
+    def test_it_creates_free_threaded_cffi_packages(self):
+        root = self.mkpkg(
+            "foo-bar",
+            "--cffi",
+            "--supports",
+            "3.14t",
+            "--supports",
+            "3.14",
+        )
+        _fix_readme(root / "foo-bar")
+        self.assertNoxSucceeds(root / "foo-bar", "-s", "tests-3.14t", "style")
+
+    def test_it_creates_mypyc_packages_that_pass_their_tests(self):
+        root = self.mkpkg("foo", "--mypyc")
+        _fix_readme(root / "foo")
+        self.assertNoxSucceeds(root / "foo")
+
+    def test_it_refuses_mypyc_single_modules(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--mypyc", "--single")
+
+    def test_it_refuses_lazy_mypyc_packages(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--mypyc", "--lazy")
+
+    def test_it_refuses_mypyc_with_cffi(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--mypyc", "--cffi")
+
+    def test_it_overlays_template_directories(self):
+        overlay = self.tmpdir()
+        (overlay / "COPYING.j2").write_text("Ours, all {{ name }}.\n")
+        foo = self.mkpkg("foo", "--closed", "--template-source", overlay)
+        copying = (foo / "foo" / "COPYING").read_text()
+        self.assertEqual(copying, "Ours, all foo.\n")
+
+    def test_it_overlays_zipped_templates(self):
+        overlays = self.tmpdir()
+        (overlays / "COPYING.j2").write_text("From the directory.\n")
+        with zipfile.ZipFile(overlays / "overlay.zip", "w") as overlay:
+            overlay.writestr("COPYING.j2", "From the zip.\n")
+        foo = self.mkpkg(
+            "foo",
+            "--closed",
+            "--template-source",
+            overlays,
+            "--template-source",
+            overlays / "overlay.zip",
+        )
+        copying = (foo / "foo" / "COPYING").read_text()
+        self.assertEqual(copying, "From the zip.\n")
+
+    def test_overlaid_templates_can_include_builtin_ones(self):
+        overlay = self.tmpdir()
+        (overlay / "tests.py.j2").write_text(
+            '{% include "partials/memory.py.j2" %}\n# ours\n',
+        )
+        foo = self.mkpkg(
+            "foo",
+            "--closed",
+            "--single",
+            "--template-source",
+            overlay,
+        )
+        tests = (foo / "foo" / "tests.py").read_text()
+        self.assertIn("def assert_within_budget", tests)
+        self.assertTrue(tests.endswith("# ours\n"))
+
+    def test_identical_templates_keep_their_own_names(self):
+        overlay = self.tmpdir()
+        (overlay / "one.j2").write_text("Same.\n")
+        (overlay / "two.j2").write_text("Same.\n")
+        env = jinja2.Environment(loader=TemplateSources([overlay]))
+        self.assertEqual(
+            [env.get_template(each).filename for each in ["one.j2", "two.j2"]],
+            [str(overlay / "one.j2"), str(overlay / "two.j2")],
+        )
+
+    def test_it_reads_template_sources_from_config(self):
+        config = self.tmpdir()
+        (config / "overlay").mkdir()
+        (config / "overlay" / "COPYING.j2").write_text("Configured.\n")
+        (config / "config.toml").write_text('template-source = "overlay"\n')
+        foo = self.mkpkg("foo", "--closed", "--config", config / "config.toml")
+        copying = (foo / "foo" / "COPYING").read_text()
+        self.assertEqual(copying, "Configured.\n")
+
+    def test_it_refuses_template_sources_it_cannot_read(self):
+        path = self.tmpdir() / "templates.txt"
+        path.write_text("nope")
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--template-source", path)
+
+    def test_it_writes_files_while_pinning_actions(self):
+        cwd = self.tmpdir()
+        pyproject = cwd / "foo" / "pyproject.toml"
+        answered = []
+        deadline = time.monotonic() + 10
+
+        class GitHub(BaseHTTPRequestHandler):
+            def do_GET(self):
+                # Hold every response until the files which don't need them
+                # have been written, which would time out if mkpkg waited.
+                while not pyproject.exists() and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                answered.append(pyproject.exists())
+
+                if self.path.endswith("/releases/latest"):
+                    body = {"tag_name": "v1.2.3"}
+                else:
+                    body = {"sha": "abc123"}
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode())
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), GitHub)
+        self.addCleanup(server.server_close)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+
+        self.mkpkg(
+            "foo",
+            cwd=cwd,
+            GITHUB_API_URL=f"http://127.0.0.1:{server.server_port}",
+        )
+
+        self.assertTrue(answered)
+        self.assertTrue(all(answered))
+        ci = (cwd / "foo" / ".github" / "workflows" / "ci.yml").read_text()
+        self.assertIn("actions/checkout@abc123  # v1.2.3", ci)
+
+    def test_it_prewarms_in_the_background(self):
+        path, _ = self.fake_uv()
+        # i.e. --prewarm takes no value, and mustn't swallow the name
+        foo = self.mkpkg("--prewarm", "foo", "--closed", PATH=path)
+        log = foo / "foo" / ".nox" / "prewarm.log"
+
+        deadline = time.monotonic() + 30
+        while "Done." not in log.read_text():
+            if time.monotonic() > deadline:
+                self.fail(f"Prewarming never finished:\n{log.read_text()}")
+            time.sleep(0.05)
+
+        self.assertEqual(
+            [line for line in log.read_text().splitlines() if "/" in line],
+            [
+                "[1/3] uv lock",
+                "[2/3] uvx nox --install-only -s tests-3.14",
+                "[3/3] uvx nox --install-only -s typing",
+            ],
+        )
+
+    def test_it_prewarms_offline(self):
+        path, calls = self.fake_uv()
+        self.mkpkg(
+            "foo",
+            "--closed",
+            "--prewarm",
+            "--foreground",
+            "--offline",
+            PATH=path,
+        )
+        self.assertEqual(
+            calls.read_text().splitlines(),
+            [
+                "uvx nox --list-sessions --json UV_OFFLINE=1",
+                "uv lock UV_OFFLINE=1",
+                "uvx nox --install-only -s tests-3.14 UV_OFFLINE=1",
+                "uvx nox --install-only -s typing UV_OFFLINE=1",
+            ],
+        )
+
+    def test_it_prewarms_from_find_links_alone(self):
+        path, calls = self.fake_uv()
+        wheels = self.tmpdir()
+        foo = self.mkpkg(
+            "foo",
+            "--closed",
+            "--prewarm",
+            "--foreground",
+            "--find-links",
+            wheels,
+            PATH=path,
+            FAKE_UV_UNREACHABLE="1",
+        )
+        sources = f"UV_FIND_LINKS={wheels} UV_NO_INDEX=1"
+        self.assertEqual(
+            calls.read_text().splitlines(),
+            [
+                "uvx nox --list-sessions --json",
+                "uv lock",
+                f"uv lock {sources}",
+                f"uvx nox --install-only -s tests-3.14 {sources}",
+                f"uvx nox --install-only -s typing {sources}",
+            ],
+        )
+        self.assertEqual(
+            (foo / "foo" / "uv.lock").read_text(),
+            f"uv lock {sources}",
+        )
+
+    def test_it_locks_against_the_real_index_when_prewarming(self):
+        path, calls = self.fake_uv()
+        foo = self.mkpkg(
+            "foo",
+            "--closed",
+            "--prewarm",
+            "--foreground",
+            "--index-url",
+            "https://mirror.example/simple",
+            PATH=path,
+        )
+        self.assertIn("uv lock", calls.read_text().splitlines())
+        self.assertEqual((foo / "foo" / "uv.lock").read_text(), "uv lock")
+
+    def test_it_fails_when_prewarming_in_the_foreground_fails(self):
+        path, _ = self.fake_uv()
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg(
+                "foo",
+                "--closed",
+                "--prewarm",
+            "--foreground",
+                PATH=path,
+                FAKE_UV_FAIL="1",
+            )
+
+    def test_it_refuses_package_sources_without_prewarming(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--closed", "--offline")
+
+    def test_it_refuses_to_prewarm_in_the_foreground_without_prewarming(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--closed", "--foreground")
+
+    def test_it_refuses_to_prewarm_bare_packages(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.mkpkg("foo", "--bare", "--prewarm")
+
     def test_it_creates_clis(self):
         foo = self.mkpkg("foo", "--cli", "bar") / "foo"
         cli = foo / "foo" / "_cli.py"
@@ -120,6 +598,32 @@ class TestMkpkg(TestCase):
             },
         )
 
+    def test_free_threaded_envs(self):
+        foo = self.mkpkg("foo", "--supports", "3.14t", "--supports", "3.14")
+        envlist = self.envs(foo / "foo")
+        self.assertEqual(
+            envlist,
+            {"tests-3.14t", "tests-3.14", "build", "style", "typing"},
+        )
+
+    def test_mypyc_envs(self):
+        envlist = self.envs(self.mkpkg("foo", "--mypyc") / "foo")
+        self.assertEqual(
+            envlist,
+            {
+                "tests-pypy3.11",
+                "tests-3.12",
+                "tests-3.13",
+                "tests-3.14",
+                "tests(compiled)-3.12",
+                "tests(compiled)-3.13",
+                "tests(compiled)-3.14",
+                "build",
+                "style",
+                "typing",
+            },
+        )
+
     def test_it_runs_style_checks_by_default(self):
         envlist = self.envs(self.mkpkg("foo") / "foo")
         self.assertIn("style", envlist)
@@ -132,6 +636,14 @@ class TestMkpkg(TestCase):
         envlist = self.envs(self.mkpkg("foo", "--no-style") / "foo")
         self.assertNotIn("style", envlist)
 
+    def assertFormatted(self, *paths):
+        subprocess.run(
+            [sys.executable, "-m", "ruff", "format", "--check", *paths],
+            cwd=paths[0].parent,
+            check=True,
+            capture_output=True,
+        )
+
     def assertNoxSucceeds(self, *args, **kwargs):
         try:
             self.nox(*args, **kwargs)
@@ -144,23 +656,46 @@ class TestMkpkg(TestCase):
                 sys.stderr.buffer.write(error.stderr)
             self.fail(error)
 
-    def mkpkg(self, *argv):
+    def fake_uv(self):
+        """
+        Put fake uv and uvx executables on a PATH, which record their calls.
+
+        Returns the PATH to use and the file calls are recorded in.
+        """
+        bin = self.tmpdir()
+        calls = bin / "calls"
+        calls.touch()
+        for name in "uv", "uvx":
+            fake = bin / name
+            fake.write_text(f"#!{sys.executable}\n{FAKE_UV.format(str(calls))}")
+            fake.chmod(0o755)
+        return f"{bin}{os.pathsep}{os.environ.get('PATH', '')}", calls
+
+    def tmpdir(self):
         directory = TemporaryDirectory()
         self.addCleanup(directory.cleanup)
+        return Path(directory.name)
+
+    def mkpkg(self, *argv, cwd=None, **env):
+        if cwd is None:
+            cwd = self.tmpdir()
         subprocess.run(
             [sys.executable, "-m", "mkpkg", *argv],
-            cwd=directory.name,
+            cwd=cwd,
             env=dict(
+                # don't pick up any config from whoever is running the tests
+                XDG_CONFIG_HOME=str(self.tmpdir()),
                 GIT_AUTHOR_NAME="mkpkg unittests",
                 GIT_AUTHOR_EMAIL="mkpkg-unittests@local",
                 GIT_COMMITTER_NAME="mkpkg unittests",
                 GIT_COMMITTER_EMAIL="mkpkg-unittests@local",
                 PATH=os.environ.get("PATH", ""),  # needed to find e.g. git
-            ),
+            )
+            | env,
             stdout=subprocess.DEVNULL,
             check=True,
         )
-        return Path(directory.name)
+        return cwd
 
     def nox(self, path, *argv):
         directory = TemporaryDirectory()
@@ -201,6 +736,43 @@ class TestMkpkg(TestCase):
         return venv
 
 
+# Register a lazily loaded name, then check its submodule is loaded only once
+# it is accessed.
+ACCESS_LAZILY = """\
+import sys, foo
+foo._LAZY["main"] = "_cli"
+print("foo._cli" in sys.modules)
+foo.main
+print("foo._cli" in sys.modules)
+"""
+
+FAKE_UV = """\
+from pathlib import Path
+import json
+import os
+import sys
+
+call = [Path(sys.argv[0]).name, *sys.argv[1:]]
+for name in "UV_FIND_LINKS", "UV_NO_INDEX", "UV_DEFAULT_INDEX", "UV_OFFLINE":
+    if name in os.environ:
+        call.append(f"{{name}}={{os.environ[name]}}")
+with open({!r}, "a") as calls:
+    calls.write(" ".join(call) + "\\n")
+
+if "FAKE_UV_FAIL" in os.environ:
+    sys.exit(1)
+if "--list-sessions" in sys.argv:
+    print(json.dumps([{{"session": "tests-3.14"}}, {{"session": "typing"}}]))
+elif "lock" in sys.argv or "--install-only" in sys.argv:
+    # without any other packages, locking needs the (real) index
+    offline = "FAKE_UV_UNREACHABLE" in os.environ
+    if "lock" in sys.argv and offline and "UV_FIND_LINKS" not in os.environ:
+        sys.exit(1)
+    # like uv lock, or the uv sync which installing runs
+    Path("uv.lock").write_text(" ".join(call))
+"""
+
+
 def _fix_readme(path):
     # Just the heading on the readme isn't good enough...
     with (path / "README.rst").open("at") as readme: